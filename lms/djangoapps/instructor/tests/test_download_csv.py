@@ -8,6 +8,7 @@ Notes for running by hand:
 django-admin.py test --settings=lms.envs.test --pythonpath=. lms/djangoapps/instructor
 """
 
+from django.test import TestCase
 from django.test.utils import override_settings
 
 # Need access to internal func to put users in the right group
@@ -18,6 +19,7 @@ from django.core.urlresolvers import reverse
 from courseware.access import _course_staff_group_name
 from courseware.tests.helpers import LoginEnrollmentTestCase
 from courseware.tests.modulestore_config import TEST_DATA_XML_MODULESTORE
+from instructor.views import _csv_lines
 from xmodule.modulestore.django import modulestore
 import xmodule.modulestore.django
 
@@ -61,7 +63,7 @@ class TestInstructorDashboardGradeDownloadCSV(LoginEnrollmentTestCase):
         response = self.client.post(url, {'action': 'Download CSV of all student grades for this course'})
         msg += "instructor dashboard download csv grades: response = '{0}'\n".format(response)
 
-        self.assertEqual(response['Content-Type'], 'text/csv', msg)
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8', msg)
 
         cdisp = response['Content-Disposition']
         msg += "Content-Disposition = '%s'\n" % cdisp
@@ -77,3 +79,17 @@ class TestInstructorDashboardGradeDownloadCSV(LoginEnrollmentTestCase):
 '''
 
         self.assertEqual(body, expected_body, msg)
+
+
+class TestCsvLines(TestCase):
+    '''
+    Check formatting of datatables as CSV
+    '''
+
+    def test_unicode_header_and_data(self):
+        datatable = {'header': [u'Username', u'Pr\xfcfung 01'],
+                     'data': [[u'u1', u'\xe9t\xe9'], ['u2', 0.5]]}
+        lines = list(_csv_lines(datatable))
+        self.assertEqual(lines, ['"Username","Pr\xc3\xbcfung 01"\r\n',
+                                 '"u1","\xc3\xa9t\xc3\xa9"\r\n',
+                                 '"u2","0.5"\r\n'])
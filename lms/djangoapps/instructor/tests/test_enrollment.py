@@ -12,8 +12,10 @@ from xmodule.modulestore.tests.factories import CourseFactory
 from student.tests.factories import UserFactory, CourseEnrollmentFactory, AdminFactory
 from xmodule.modulestore.tests.django_utils import ModuleStoreTestCase
 from student.models import CourseEnrollment, CourseEnrollmentAllowed
-from instructor.views import get_and_clean_student_list, send_mail_to_student
+from instructor.views import get_and_clean_student_list, send_mail_to_student, _do_enroll_students
 from django.core import mail
+from django.db import connection
+from mock import patch
 
 USER_COUNT = 4
 
@@ -256,3 +258,199 @@ class TestInstructorEnrollsStudent(ModuleStoreTestCase, LoginEnrollmentTestCase)
 
         send_mail_ret = send_mail_to_student('student0@test.com', d)
         self.assertFalse(send_mail_ret)
+
+    def test_enrollment_assigns_forum_role(self):
+        """
+        Enrolling a registered but not yet enrolled user gives them the default forum role
+        """
+
+        course = self.course
+        user = UserFactory.create(username="student5_0", email="student5_0@test.com")
+
+        url = reverse('instructor_dashboard', kwargs={'course_id': course.id})
+        response = self.client.post(url, {'action': 'Enroll multiple students', 'multiple_students': 'student5_0@test.com'})
+        self.assertContains(response, '<td>added</td>')
+
+        self.assertEqual(1, CourseEnrollment.objects.filter(course_id=course.id, user=user).count())
+        roles = [role.name for role in user.roles.filter(course_id=course.id)]
+        self.assertEqual(['Student'], roles)
+
+    def _count_enroll_queries(self, students):
+        """
+        Return the number of queries made enrolling the given string of students
+        """
+        old_use_debug_cursor = connection.use_debug_cursor
+        connection.use_debug_cursor = True
+        start = len(connection.queries)
+        try:
+            _do_enroll_students(self.course, self.course.id, students)
+        finally:
+            connection.use_debug_cursor = old_use_debug_cursor
+        return len(connection.queries) - start
+
+    def test_enrollment_queries_are_batched(self):
+        """
+        The number of queries does not grow with the number of already enrolled or unregistered students
+        """
+
+        few = 'student0@test.com, student6_0@test.com'
+        many = ', '.join(['student%d@test.com' % i for i in xrange(USER_COUNT)] +
+                         ['student7_%d@test.com' % i for i in xrange(20)])
+        self.assertEqual(self._count_enroll_queries(few), self._count_enroll_queries(many))
+
+    def test_unenrollment_of_enrolled_and_allowed_student(self):
+        """
+        Un-enrolling a student who is both enrolled and on the pending enrollment list
+        """
+
+        course = self.course
+        CourseEnrollmentAllowed(email='student0@test.com', course_id=course.id).save()
+
+        url = reverse('instructor_dashboard', kwargs={'course_id': course.id})
+        response = self.client.post(url, {'action': 'Unenroll multiple students', 'multiple_students': 'student0@test.com', 'email_students': 'on'})
+
+        self.assertContains(response, '<td>student0@test.com</td>')
+        self.assertContains(response, '<td>un-enrolled, email sent</td>')
+        self.assertEqual(0, CourseEnrollment.objects.filter(course_id=course.id, user=self.users[0]).count())
+        self.assertEqual(0, CourseEnrollmentAllowed.objects.filter(course_id=course.id, email='student0@test.com').count())
+
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].subject, 'You have been un-enrolled from MITx/999/Robot_Super_Course')
+        self.assertTrue(mail.outbox[0].body.startswith("Dear {0} {1}".format(self.users[0].first_name, self.users[0].last_name)))
+
+    def test_enrollment_updates_existing_allowed_auto_enroll(self):
+        """
+        Re-inviting a student updates the auto_enroll flag of their pending enrollment
+        """
+
+        course = self.course
+        CourseEnrollmentAllowed(email='student8_0@test.com', course_id=course.id, auto_enroll=False).save()
+
+        url = reverse('instructor_dashboard', kwargs={'course_id': course.id})
+        response = self.client.post(url, {'action': 'Enroll multiple students', 'multiple_students': 'student8_0@test.com', 'auto_enroll': 'on'})
+
+        self.assertContains(response, '<td>user does not exist, enrollment already allowed, pending with auto enrollment on</td>')
+        cea = CourseEnrollmentAllowed.objects.filter(email='student8_0@test.com', course_id=course.id)
+        self.assertEqual(1, len(cea))
+        self.assertEqual(1, cea[0].auto_enroll)
+
+    def test_enrollment_repeated_emails(self):
+        """
+        An email given more than once, in any case, gets a single pending enrollment
+        """
+
+        course = self.course
+
+        url = reverse('instructor_dashboard', kwargs={'course_id': course.id})
+        response = self.client.post(url, {'action': 'Enroll multiple students',
+                                          'multiple_students': 'student9_0@test.com, student9_0@test.com Student9_0@Test.com'})
+
+        self.assertContains(response, '<td>student9_0@test.com</td>')
+        self.assertContains(response, '<td>Student9_0@Test.com</td>')
+        # repeats are reported with the status of the first occurrence
+        self.assertContains(response, '<td>user does not exist, enrollment allowed, pending with auto enrollment off</td>', count=2)
+        self.assertNotContains(response, 'enrollment already allowed')
+        cea = CourseEnrollmentAllowed.objects.filter(email__in=['student9_0@test.com', 'Student9_0@Test.com'], course_id=course.id)
+        self.assertEqual(1, len(cea))
+
+    def test_enrollment_known_and_unknown_students(self):
+        """
+        Enroll a mix of registered, already enrolled and unregistered students at once
+        """
+
+        course = self.course
+        user = UserFactory.create(username="student10_0", email="student10_0@test.com")
+
+        url = reverse('instructor_dashboard', kwargs={'course_id': course.id})
+        response = self.client.post(url, {'action': 'Enroll multiple students',
+                                          'multiple_students': 'student10_0@test.com, student0@test.com, student10_1@test.com'})
+
+        self.assertContains(response, '<td>added</td>')
+        self.assertContains(response, '<td>already enrolled</td>')
+        self.assertContains(response, '<td>user does not exist, enrollment allowed, pending with auto enrollment off</td>')
+
+        self.assertEqual(1, CourseEnrollment.objects.filter(course_id=course.id, user=user).count())
+        self.assertEqual(USER_COUNT + 1, CourseEnrollment.objects.filter(course_id=course.id).count())
+        self.assertEqual(1, CourseEnrollmentAllowed.objects.filter(course_id=course.id, email='student10_1@test.com').count())
+        self.assertEqual(0, CourseEnrollmentAllowed.objects.filter(course_id=course.id, email='student10_0@test.com').count())
+
+    def test_enrollment_email_case_insensitive(self):
+        """
+        A registered student is found whatever the case of the email address entered
+        """
+
+        course = self.course
+        user = UserFactory.create(username="student11_0", email="student11_0@x.com")
+
+        url = reverse('instructor_dashboard', kwargs={'course_id': course.id})
+        response = self.client.post(url, {'action': 'Enroll multiple students', 'multiple_students': 'Student11_0@X.com'})
+
+        self.assertContains(response, '<td>Student11_0@X.com</td>')
+        self.assertContains(response, '<td>added</td>')
+        self.assertEqual(1, CourseEnrollment.objects.filter(course_id=course.id, user=user).count())
+        self.assertEqual(0, CourseEnrollmentAllowed.objects.filter(course_id=course.id).count())
+
+    def test_enrollment_repeated_registered_email(self):
+        """
+        A registered student whose address is given twice is enrolled and emailed once
+        """
+
+        course = self.course
+        user = UserFactory.create(username="student12_0", email="student12_0@test.com", first_name="Jim", last_name="Tester")
+
+        url = reverse('instructor_dashboard', kwargs={'course_id': course.id})
+        response = self.client.post(url, {'action': 'Enroll multiple students',
+                                          'multiple_students': 'student12_0@test.com, student12_0@test.com',
+                                          'email_students': 'on'})
+
+        self.assertContains(response, '<td>added, email sent</td>')
+        self.assertNotContains(response, '<td>already enrolled</td>')
+        self.assertEqual(1, CourseEnrollment.objects.filter(course_id=course.id, user=user).count())
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].subject, 'You have been enrolled in MITx/999/Robot_Super_Course')
+
+    def test_unenrollment_repeated_emails(self):
+        """
+        Students whose addresses are given more than once, in any case, are un-enrolled and emailed once
+        """
+
+        course = self.course
+        CourseEnrollmentAllowed(email='student13_0@test.com', course_id=course.id).save()
+
+        url = reverse('instructor_dashboard', kwargs={'course_id': course.id})
+        response = self.client.post(url, {'action': 'Unenroll multiple students',
+                                          'multiple_students': 'student0@test.com Student0@Test.com student0@test.com, '
+                                                               'student13_0@test.com STUDENT13_0@test.com',
+                                          'email_students': 'on'})
+
+        self.assertContains(response, '<td>Student0@Test.com</td>')
+        self.assertContains(response, '<td>STUDENT13_0@test.com</td>')
+        self.assertContains(response, '<td>un-enrolled, email sent</td>', count=4)
+        self.assertEqual(0, CourseEnrollment.objects.filter(course_id=course.id, user=self.users[0]).count())
+        self.assertEqual(len(mail.outbox), 2)
+
+    @patch('instructor.views.QUERY_BATCH_SIZE', 2)
+    def test_enrollment_in_batches(self):
+        """
+        Enroll and un-enroll more students than fit in a single batch of lookups
+        """
+
+        course = self.course
+        new_user = UserFactory.create(username="student14_0", email="student14_0@test.com")
+        students = 'student0@test.com student1@test.com student14_0@test.com student14_1@test.com student14_2@test.com'
+
+        url = reverse('instructor_dashboard', kwargs={'course_id': course.id})
+        response = self.client.post(url, {'action': 'Enroll multiple students', 'multiple_students': students})
+
+        self.assertContains(response, '<td>already enrolled</td>', count=2)
+        self.assertContains(response, '<td>added</td>', count=1)
+        self.assertContains(response, '<td>user does not exist, enrollment allowed, pending with auto enrollment off</td>', count=2)
+        self.assertEqual(USER_COUNT + 1, CourseEnrollment.objects.filter(course_id=course.id).count())
+        self.assertEqual(2, CourseEnrollmentAllowed.objects.filter(course_id=course.id).count())
+
+        response = self.client.post(url, {'action': 'Unenroll multiple students', 'multiple_students': students})
+
+        self.assertContains(response, '<td>un-enrolled</td>', count=5)
+        self.assertEqual(0, CourseEnrollment.objects.filter(course_id=course.id, user=new_user).count())
+        self.assertEqual(USER_COUNT - 2, CourseEnrollment.objects.filter(course_id=course.id).count())
+        self.assertEqual(0, CourseEnrollmentAllowed.objects.filter(course_id=course.id).count())
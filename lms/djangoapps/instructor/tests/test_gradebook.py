@@ -3,6 +3,7 @@ Tests of the instructor dashboard gradebook
 """
 
 from django.test.utils import override_settings
+from mock import patch
 from django.core.urlresolvers import reverse
 from xmodule.modulestore.tests.factories import CourseFactory, ItemFactory
 from student.tests.factories import UserFactory, CourseEnrollmentFactory, AdminFactory
@@ -149,3 +150,20 @@ class TestLetterCutoffPolicy(TestGradebook):
         # User 0 has 0 on the class [1]
         # One use at the top of the page [1]
         self.assertEquals(3, self.response.content.count('grade_None'))
+
+
+class TestGradebookPagination(TestGradebook):
+    def setUp(self):
+        with patch('instructor.views.GRADEBOOK_PAGE_SIZE', 5):
+            super(TestGradebookPagination, self).setUp()
+            self.last_page_response = self.client.get(reverse('gradebook', args=(self.course.id,)), {'page': 3})
+
+    def test_first_page(self):
+        self.assertIn('Page 1 of 3', self.response.content)
+        self.assertIn('?page=2', self.response.content)
+
+    def test_last_page(self):
+        self.assertEquals(self.last_page_response.status_code, 200)
+        self.assertIn('Page 3 of 3', self.last_page_response.content)
+        self.assertIn('?page=2', self.last_page_response.content)
+        self.assertNotIn('?page=4', self.last_page_response.content)
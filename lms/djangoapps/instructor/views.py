@@ -21,6 +21,7 @@ from django_future.csrf import ensure_csrf_cookie
 from django.views.decorators.cache import cache_control
 from django.core.urlresolvers import reverse
 from django.core.mail import send_mail
+from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
 
 import xmodule.graders as xmgraders
 from xmodule.modulestore.django import modulestore
@@ -56,12 +57,56 @@ log = logging.getLogger(__name__)
 FORUM_ROLE_ADD = 'add'
 FORUM_ROLE_REMOVE = 'remove'
 
+# dashboard actions that are handled by the same branch of instructor_dashboard
+ASSIGNMENT_GRADES_ACTIONS = frozenset([
+    'Display grades for assignment',
+    'Export grades for assignment to remote gradebook',
+    'Export CSV file of grades for assignment',
+])
+REMOTE_GRADEBOOK_MEMBERSHIP_ACTIONS = frozenset([
+    'List students in section in remote gradebook',
+    'Overload enrollment list using remote gradebook',
+    'Merge enrollment list with remote gradebook',
+])
+
+# analytics fetched from the analytics server for the dashboard's Analytics mode
+DASHBOARD_ANALYTICS = (
+    # "StudentsAttemptedProblems",  # num students who tried given problem
+    "StudentsDailyActivity",  # active students by day
+    "StudentsDropoffPerDay",  # active students dropoff by day
+    # "OverallGradeDistribution",  # overall point distribution for course
+    "StudentsActive",  # num students active in time period (default = 1wk)
+    "StudentsEnrolled",  # num students enrolled
+    # "StudentsPerProblemCorrect",  # foreach problem, num students correct
+    "ProblemGradeDistribution",  # foreach problem, grade distribution
+)
+
+# number of students shown on each page of the gradebook
+GRADEBOOK_PAGE_SIZE = 1000
+
+# maximum number of rows inserted, or values looked up, by a single query when
+# (un)enrolling students: backends limit the size of a query (e.g. SQLite allows
+# at most 999 parameters)
+QUERY_BATCH_SIZE = 100
+
+# CSV rows are encoded to utf-8 by _csv_lines, so declare that charset
+CSV_CONTENT_TYPE = 'text/csv; charset=utf-8'
+
+# (subject, message) templates for each type of enrollment email
+EMAIL_TEMPLATE_DICT = {'allowed_enroll': ('emails/enroll_email_allowedsubject.txt', 'emails/enroll_email_allowedmessage.txt'),
+                       'enrolled_enroll': ('emails/enroll_email_enrolledsubject.txt', 'emails/enroll_email_enrolledmessage.txt'),
+                       'allowed_unenroll': ('emails/unenroll_email_subject.txt', 'emails/unenroll_email_allowedmessage.txt'),
+                       'enrolled_unenroll': ('emails/unenroll_email_subject.txt', 'emails/unenroll_email_enrolledmessage.txt')}
+
+# separators accepted between entries of user-supplied lists of students
+SPLIT_BY_COMMA_AND_WHITESPACE_RE = re.compile(r'[\s,]')
+
 
 def split_by_comma_and_whitespace(s):
     """
     Return string s, split by , or whitespace
     """
-    return re.split(r'[\s,]', s)
+    return SPLIT_BY_COMMA_AND_WHITESPACE_RE.split(s)
 
 
 @ensure_csrf_cookie
@@ -110,18 +155,21 @@ def instructor_dashboard(request, course_id):
         return datatable
 
     def return_csv(fn, datatable, fp=None):
-        """Outputs a CSV file from the contents of a datatable."""
+        """
+        Outputs a CSV file from the contents of a datatable.
+
+        CSV lines are formatted as the response is sent.  Under Django 1.4 that
+        happens after request_finished has closed the database connection, so
+        datatable['data'] must already hold its rows (e.g. a list), and must
+        not be a queryset or anything else that touches the database.
+        """
         if fp is None:
-            response = HttpResponse(mimetype='text/csv')
+            response = HttpResponse(_csv_lines(datatable), content_type=CSV_CONTENT_TYPE)
             response['Content-Disposition'] = 'attachment; filename={0}'.format(fn)
-        else:
-            response = fp
-        writer = csv.writer(response, dialect='excel', quotechar='"', quoting=csv.QUOTE_ALL)
-        writer.writerow(datatable['header'])
-        for datarow in datatable['data']:
-            encoded_row = [unicode(s).encode('utf-8') for s in datarow]
-            writer.writerow(encoded_row)
-        return response
+            return response
+        for line in _csv_lines(datatable):
+            fp.write(line)
+        return fp
 
     def get_staff_group(course):
         """Get or create the staff access group"""
@@ -160,7 +208,7 @@ def instructor_dashboard(request, course_id):
         is provided, "problem" is assumed.
         """
         # tolerate an XML suffix in the urlname
-        if urlname[-4:] == ".xml":
+        if urlname.endswith(".xml"):
             urlname = urlname[:-4]
 
         # implement default
@@ -168,8 +216,8 @@ def instructor_dashboard(request, course_id):
             urlname = "problem/" + urlname
 
         # complete the url using information about the current course:
-        (org, course_name, _) = course_id.split("/")
-        return "i4x://" + org + "/" + course_name + "/" + urlname
+        (org, course_name, _) = course_id.split("/", 2)
+        return "i4x://%s/%s/%s" % (org, course_name, urlname)
 
     def get_student_from_identifier(unique_student_identifier):
         """Gets a student object using either an email address or username"""
@@ -248,7 +296,7 @@ def instructor_dashboard(request, course_id):
 
     elif 'Download CSV of answer distributions' in action:
         track.views.server_track(request, "dump-answer-dist-csv", {}, page="idashboard")
-        return return_csv('answer_dist_{0}.csv'.format(course_id), get_answers_distribution(request, course_id))
+        return return_csv('answer_dist_{0}.csv'.format(course_id), get_answers_distribution(request, course_id, course=course))
 
     elif 'Dump description of graded assignments configuration' in action:
         # what is "graded assignments configuration"?
@@ -406,8 +454,7 @@ def instructor_dashboard(request, course_id):
         datatable['data'] = [[x.email, domatch(x)] for x in stud_data['students']]
         datatable['title'] = action
 
-    elif action in ['Display grades for assignment', 'Export grades for assignment to remote gradebook',
-                    'Export CSV file of grades for assignment']:
+    elif action in ASSIGNMENT_GRADES_ACTIONS:
 
         log.debug(action)
         datatable = {}
@@ -449,10 +496,7 @@ def instructor_dashboard(request, course_id):
         group = get_instructor_group(course)
         msg += 'Instructor group = {0}'.format(group.name)
         log.debug('instructor grp={0}'.format(group.name))
-        uset = group.user_set.all()
-        datatable = {'header': ['Username', 'Full name']}
-        datatable['data'] = [[x.username, x.profile.name] for x in uset]
-        datatable['title'] = 'List of Instructors in course {0}'.format(course_id)
+        datatable = _group_members_table(group, 'List of Instructors', course_id)
         track.views.server_track(request, "list-instructors", {}, page="idashboard")
 
     elif action == 'Add course staff':
@@ -497,27 +541,25 @@ def instructor_dashboard(request, course_id):
     # DataDump
 
     elif 'Download CSV of all student profile data' in action:
-        enrolled_students = User.objects.filter(courseenrollment__course_id=course_id).order_by('username').select_related("profile")
+        enrolled_students = User.objects.filter(courseenrollment__course_id=course_id).order_by('username')
         profkeys = ['name', 'language', 'location', 'year_of_birth', 'gender', 'level_of_education',
                     'mailing_address', 'goals']
         datatable = {'header': ['username', 'email'] + profkeys}
-
-        def getdat(u):
-            p = u.profile
-            return [u.username, u.email] + [getattr(p, x, '') for x in profkeys]
-
-        datatable['data'] = [getdat(u) for u in enrolled_students]
+        # have the database return the rows as tuples, without building User and UserProfile objects.
+        # The rows are fetched here, while the request's connection is still open (see return_csv)
+        datatable['data'] = list(enrolled_students.values_list('username', 'email',
+                                                               *['profile__' + x for x in profkeys]))
         datatable['title'] = 'Student profile data for course %s' % course_id
         return return_csv('profiledata_%s.csv' % course_id, datatable)
 
     elif 'Download CSV of all responses to problem' in action:
         problem_to_dump = request.POST.get('problem_to_dump', '')
 
-        if problem_to_dump[-4:] == ".xml":
+        if problem_to_dump.endswith(".xml"):
             problem_to_dump = problem_to_dump[:-4]
         try:
-            (org, course_name, _) = course_id.split("/")
-            module_state_key = "i4x://" + org + "/" + course_name + "/problem/" + problem_to_dump
+            (org, course_name, _) = course_id.split("/", 2)
+            module_state_key = "i4x://%s/%s/problem/%s" % (org, course_name, problem_to_dump)
             smdat = StudentModule.objects.filter(course_id=course_id,
                                                  module_state_key=module_state_key)
             smdat = smdat.order_by('student')
@@ -637,9 +679,7 @@ def instructor_dashboard(request, course_id):
         msg2, datatable = _do_remote_gradebook(request.user, course, 'get-sections')
         msg += msg2
 
-    elif action in ['List students in section in remote gradebook',
-                    'Overload enrollment list using remote gradebook',
-                    'Merge enrollment list with remote gradebook']:
+    elif action in REMOTE_GRADEBOOK_MEMBERSHIP_ACTIONS:
 
         section = request.POST.get('gradebook_section', '')
         msg2, datatable = _do_remote_gradebook(request.user, course, 'get-membership', dict(section=section))
@@ -691,16 +731,6 @@ def instructor_dashboard(request, course_id):
     analytics_results = {}
 
     if idash_mode == 'Analytics':
-        DASHBOARD_ANALYTICS = [
-            # "StudentsAttemptedProblems",  # num students who tried given problem
-            "StudentsDailyActivity",  # active students by day
-            "StudentsDropoffPerDay",  # active students dropoff by day
-            # "OverallGradeDistribution",  # overall point distribution for course
-            "StudentsActive",  # num students active in time period (default = 1wk)
-            "StudentsEnrolled",  # num students enrolled
-            # "StudentsPerProblemCorrect",  # foreach problem, num students correct
-            "ProblemGradeDistribution",  # foreach problem, grade distribution
-        ]
         for analytic_name in DASHBOARD_ANALYTICS:
             analytics_results[analytic_name] = get_analytics_result(analytic_name)
 
@@ -747,6 +777,29 @@ def instructor_dashboard(request, course_id):
     return render_to_response('courseware/instructor_dashboard.html', context)
 
 
+class _EchoBuffer(object):
+    """
+    File-like object whose write() just returns what it is given, so that
+    csv.writer can be used to format one line at a time.
+    """
+    def write(self, value):
+        return value
+
+
+def _csv_lines(datatable):
+    """
+    Generate the utf-8 encoded lines of a CSV file for a datatable: the header,
+    then one line per row of datatable['data'].  Since this runs while the
+    response is being sent, an error here truncates the download rather than
+    producing a 500; header and data cells are encoded alike so that non-ASCII
+    labels cannot fail here.
+    """
+    writer = csv.writer(_EchoBuffer(), dialect='excel', quotechar='"', quoting=csv.QUOTE_ALL)
+    yield writer.writerow([unicode(s).encode('utf-8') for s in datatable['header']])
+    for datarow in datatable['data']:
+        yield writer.writerow([unicode(s).encode('utf-8') for s in datarow])
+
+
 def _do_remote_gradebook(user, course, action, args=None, files=None):
     '''
     Perform remote gradebook action.  Returns msg, datatable.
@@ -813,10 +866,15 @@ def _list_course_forum_members(course_id, rolename, datatable):
         role = Role.objects.get(name=rolename, course_id=course_id)
     except Role.DoesNotExist:
         return '<font color="red">Error: unknown rolename "{0}"</font>'.format(rolename)
-    uset = role.users.all().order_by('username')
+    uset = list(role.users.order_by('username').values_list('id', 'username', 'profile__name'))
     msg = 'Role = {0}'.format(rolename)
     log.debug('role={0}'.format(rolename))
-    datatable['data'] = [[x.username, x.profile.name, ', '.join([r.name for r in x.roles.filter(course_id=course_id).order_by('name')])] for x in uset]
+    # fetch the course roles of all listed users in one query, rather than one per user
+    user_roles = defaultdict(list)
+    memberships = Role.users.through.objects.filter(role__course_id=course_id, user__in=[x[0] for x in uset])
+    for user_id, role_name in memberships.order_by('role__name').values_list('user_id', 'role__name'):
+        user_roles[user_id].append(role_name)
+    datatable['data'] = [[username, name or '', ', '.join(user_roles[user_id])] for user_id, username, name in uset]
     return msg
 
 
@@ -876,12 +934,12 @@ def _group_members_table(group, title, course_id):
     Returns:
         a dictionary with keys
         'header': ['Username', 'Full name'],
-        'data': [[username, name] for all users]
+        'data': [(username, name) for all users], with name '' for users without a profile
         'title': "{title} in course {course}"
     """
-    uset = group.user_set.all()
     datatable = {'header': ['Username', 'Full name']}
-    datatable['data'] = [[x.username, x.profile.name] for x in uset]
+    datatable['data'] = [(username, name or '') for username, name
+                         in group.user_set.values_list('username', 'profile__name')]
     datatable['title'] = '{0} in course {1}'.format(title, course_id)
     return datatable
 
@@ -1021,8 +1079,14 @@ def gradebook(request, course_id):
 
     enrolled_students = User.objects.filter(courseenrollment__course_id=course_id).order_by('username').select_related("profile")
 
-    # TODO (vshnayder): implement pagination.
-    enrolled_students = enrolled_students[:1000]   # HACK!
+    # grade one page of students at a time, selected with the 'page' GET attribute
+    paginator = Paginator(enrolled_students, GRADEBOOK_PAGE_SIZE)
+    try:
+        page = paginator.page(request.GET.get('page', 1))
+    except PageNotAnInteger:
+        page = paginator.page(1)
+    except EmptyPage:
+        page = paginator.page(paginator.num_pages)
 
     student_info = [{'username': student.username,
                      'id': student.id,
@@ -1030,10 +1094,11 @@ def gradebook(request, course_id):
                      'grade_summary': student_grades(student, request, course),
                      'realname': student.profile.name,
                      }
-                    for student in enrolled_students]
+                    for student in page.object_list]
 
     return render_to_response('courseware/gradebook.html', {
         'students': student_info,
+        'page': page,
         'course': course,
         'course_id': course_id,
         # Checked above
@@ -1072,7 +1137,7 @@ def _do_enroll_students(course, course_id, students, overload=False, auto_enroll
     status = dict([x, 'unprocessed'] for x in new_students)
 
     if overload:  	# delete all but staff
-        todelete = CourseEnrollment.objects.filter(course_id=course_id)
+        todelete = CourseEnrollment.objects.filter(course_id=course_id).select_related('user')
         for ce in todelete:
             if not has_access(ce.user, course, 'staff') and ce.user.email.lower() not in new_students_lc:
                 status[ce.user.email] = 'deleted'
@@ -1094,70 +1159,106 @@ def _do_enroll_students(course, course_id, students, overload=False, auto_enroll
              'course_url': 'https://' + settings.SITE_NAME + '/courses/' + course_id,
              }
 
-    for student in new_students:
-        try:
-            user = User.objects.get(email=student)
-        except User.DoesNotExist:
+    # resolve the students who already have accounts
+    users = _get_users_by_email(new_students)
+
+    # find out who is already enrolled with a query per batch, rather than one per student
+    enrolled_user_ids = set()
+    for user_ids in _in_batches([user.id for user in users.values()]):
+        enrolled_user_ids.update(CourseEnrollment.objects.filter(course_id=course_id, user_id__in=user_ids)
+                                 .values_list('user_id', flat=True))
+
+    # likewise for the pending enrollments of students who have not signed up yet
+    allowed_lc = set()
+    for emails in _in_batches([s for s, s_lc in zip(new_students, new_students_lc) if s_lc not in users]):
+        ceaset = CourseEnrollmentAllowed.objects.filter(course_id=course_id, email__in=emails)
+        allowed_lc.update(email.lower() for email in ceaset.values_list('email', flat=True))
+        #If enrollmentallowed already exists, update auto_enroll flag to however it was set in UI
+        ceaset.update(auto_enroll=auto_enroll)
+
+    new_allowed = []
+    to_email = []
+    first_spelling = {}
+    repeats = []
+
+    for student, student_lc in zip(new_students, new_students_lc):
+        #Handle each address once; repeats (in any case) get the first one's status below
+        if student_lc in first_spelling:
+            repeats.append((student, first_spelling[student_lc]))
+            continue
+        first_spelling[student_lc] = student
 
-            #Student not signed up yet, put in pending enrollment allowed table
-            cea = CourseEnrollmentAllowed.objects.filter(email=student, course_id=course_id)
+        user = users.get(student_lc)
+        if user is None:
 
-            #If enrollmentallowed already exists, update auto_enroll flag to however it was set in UI
-            #Will be 0 or 1 records as there is a unique key on email + course_id
-            if cea:
-                cea[0].auto_enroll = auto_enroll
-                cea[0].save()
+            #Student not signed up yet, put in pending enrollment allowed table
+            if student_lc in allowed_lc:
                 status[student] = 'user does not exist, enrollment already allowed, pending with auto enrollment ' \
                     + ('on' if auto_enroll else 'off')
                 continue
 
             #EnrollmentAllowed doesn't exist so create it
-            cea = CourseEnrollmentAllowed(email=student, course_id=course_id, auto_enroll=auto_enroll)
-            cea.save()
+            allowed_lc.add(student_lc)
+            new_allowed.append(CourseEnrollmentAllowed(email=student, course_id=course_id, auto_enroll=auto_enroll))
 
             status[student] = 'user does not exist, enrollment allowed, pending with auto enrollment ' \
                 + ('on' if auto_enroll else 'off')
-
-            if email_students:
-                #User is allowed to enroll but has not signed up yet
-                d['email_address'] = student
-                d['message'] = 'allowed_enroll'
-                send_mail_ret = send_mail_to_student(student, d)
-                status[student] += (', email sent' if send_mail_ret else '')
+            to_email.append((student, None))
             continue
 
         #Student has already registered
-        if CourseEnrollment.objects.filter(user=user, course_id=course_id):
+        if user.id in enrolled_user_ids:
             status[student] = 'already enrolled'
             continue
 
         try:
-            #Not enrolled yet
+            #Not enrolled yet.  Saved one at a time, rather than in bulk, so that
+            #post_save receivers (e.g. assigning the default forum role) run
             ce = CourseEnrollment(user=user, course_id=course_id)
             ce.save()
+            enrolled_user_ids.add(user.id)
             status[student] = 'added'
+            to_email.append((student, user))
+        except:
+            status[student] = 'rejected'
+
+    # create all of the new pending enrollments in batches
+    _bulk_create(CourseEnrollmentAllowed, new_allowed)
 
-            if email_students:
+    # send emails last, in the order the students were given
+    if email_students:
+        for student, user in to_email:
+            d['email_address'] = student
+            if user is None:
+                #User is allowed to enroll but has not signed up yet
+                d['message'] = 'allowed_enroll'
+                send_mail_ret = send_mail_to_student(student, d)
+                status[student] += (', email sent' if send_mail_ret else '')
+            else:
                 #User enrolled for first time, populate dict with user specific info
-                d['email_address'] = student
                 d['first_name'] = user.first_name
                 d['last_name'] = user.last_name
                 d['message'] = 'enrolled_enroll'
-                send_mail_ret = send_mail_to_student(student, d)
-                status[student] += (', email sent' if send_mail_ret else '')
+                try:
+                    send_mail_ret = send_mail_to_student(student, d)
+                    status[student] += (', email sent' if send_mail_ret else '')
+                except:
+                    status[student] = 'rejected'
 
-        except:
-            status[student] = 'rejected'
+    for student, first in repeats:
+        status[student] = status[first]
 
     datatable = {'header': ['StudentEmail', 'action']}
     datatable['data'] = [[x, status[x]] for x in sorted(status)]
     datatable['title'] = 'Enrollment of students'
 
-    def sf(stat):
-        return [x for x in status if status[x] == stat]
+    # group the students by status in a single pass over the results
+    by_status = defaultdict(list)
+    for student, stat in status.iteritems():
+        by_status[stat].append(student)
 
-    data = dict(added=sf('added'), rejected=sf('rejected') + sf('exists'),
-                deleted=sf('deleted'), datatable=datatable)
+    data = dict(added=by_status['added'], rejected=by_status['rejected'] + by_status['exists'],
+                deleted=by_status['deleted'], datatable=datatable)
 
     return data
 
@@ -1172,7 +1273,7 @@ def _do_unenroll_students(course_id, students, email_students=False):
     `email_students` is user input preference (a `boolean`)
     """
 
-    old_students, _ = get_and_clean_student_list(students)
+    old_students, old_students_lc = get_and_clean_student_list(students)
     status = dict([x, 'unprocessed'] for x in old_students)
 
     if email_students:
@@ -1180,19 +1281,45 @@ def _do_unenroll_students(course_id, students, email_students=False):
         d = {'site_name': settings.SITE_NAME,
              'course_id': course_id}
 
-    for student in old_students:
+    #Remove pending enrollments a batch of students at a time
+    allowed_lc = set()
+    for emails in _in_batches(old_students):
+        ceaset = CourseEnrollmentAllowed.objects.filter(course_id=course_id, email__in=emails)
+        allowed_lc.update(email.lower() for email in ceaset.values_list('email', flat=True))
+        ceaset.delete()
+
+    users = _get_users_by_email(old_students)
+
+    #Likewise remove current enrollments
+    enrolled_user_ids = set()
+    unenroll_failed = False
+    for user_ids in _in_batches([user.id for user in users.values()]):
+        ceset = CourseEnrollment.objects.filter(course_id=course_id, user_id__in=user_ids)
+        enrolled_user_ids.update(ceset.values_list('user_id', flat=True))
+        try:
+            ceset.delete()
+        except Exception:
+            log.exception("Failed to un-enroll students from {0}".format(course_id))
+            unenroll_failed = True
+
+    first_spelling = {}
+    repeats = []
+
+    for student, student_lc in zip(old_students, old_students_lc):
+
+        #Handle each address once; repeats (in any case) get the first one's status below
+        if student_lc in first_spelling:
+            repeats.append((student, first_spelling[student_lc]))
+            continue
+        first_spelling[student_lc] = student
 
         isok = False
-        cea = CourseEnrollmentAllowed.objects.filter(course_id=course_id, email=student)
-        #Will be 0 or 1 records as there is a unique key on email + course_id
-        if cea:
-            cea[0].delete()
+        if student_lc in allowed_lc:
             status[student] = "un-enrolled"
             isok = True
 
-        try:
-            user = User.objects.get(email=student)
-        except User.DoesNotExist:
+        user = users.get(student_lc)
+        if user is None:
 
             if isok and email_students:
                 #User was allowed to join but had not signed up yet
@@ -1203,11 +1330,12 @@ def _do_unenroll_students(course_id, students, email_students=False):
 
             continue
 
-        ce = CourseEnrollment.objects.filter(user=user, course_id=course_id)
-        #Will be 0 or 1 records as there is a unique key on user + course_id
-        if ce:
+        if user.id in enrolled_user_ids:
+            if unenroll_failed:
+                if not isok:
+                    status[student] = "Error!  Failed to un-enroll"
+                continue
             try:
-                ce[0].delete()
                 status[student] = "un-enrolled"
                 if email_students:
                     #User was enrolled
@@ -1222,6 +1350,9 @@ def _do_unenroll_students(course_id, students, email_students=False):
                 if not isok:
                     status[student] = "Error!  Failed to un-enroll"
 
+    for student, first in repeats:
+        status[student] = status[first]
+
     datatable = {'header': ['StudentEmail', 'action']}
     datatable['data'] = [[x, status[x]] for x in sorted(status)]
     datatable['title'] = 'Un-enrollment of students'
@@ -1230,6 +1361,46 @@ def _do_unenroll_students(course_id, students, email_students=False):
     return data
 
 
+def _in_batches(items):
+    """
+    Split the list `items` into lists of at most QUERY_BATCH_SIZE items, so that
+    no single query inserts or looks up too many values.
+    """
+    for start in xrange(0, len(items), QUERY_BATCH_SIZE):
+        yield items[start:start + QUERY_BATCH_SIZE]
+
+
+def _bulk_create(model, objs):
+    """
+    Insert the unsaved model instances `objs` using as few queries as possible,
+    in batches of QUERY_BATCH_SIZE rows (Django 1.4's bulk_create does not
+    batch itself).
+
+    Like bulk_create, this does not call save() or send post_save, so it must
+    only be used for models without save-time behavior, such as
+    CourseEnrollmentAllowed (CourseEnrollment has post_save receivers).
+    """
+    for batch in _in_batches(objs):
+        model.objects.bulk_create(batch)
+
+
+def _get_users_by_email(emails):
+    """
+    Look up the users with any of the given email addresses, with one query
+    per batch of QUERY_BATCH_SIZE addresses.
+
+    Returns a dict mapping lower case email address to User.  Addresses match
+    case-insensitively under MySQL's collation; on other databases the lower
+    case form of each address is looked up too, so a user whose email is
+    stored in lower case is found however the address was typed.
+    """
+    emails = list(set(emails) | set(email.lower() for email in emails))
+    users = {}
+    for batch in _in_batches(emails):
+        users.update((user.email.lower(), user) for user in User.objects.filter(email__in=batch))
+    return users
+
+
 def send_mail_to_student(student, param_dict):
     """
     Construct the email using templates and then send it.
@@ -1248,12 +1419,6 @@ def send_mail_to_student(student, param_dict):
                                         ]
     Returns a boolean indicating whether the email was sent successfully.
     """
-
-    EMAIL_TEMPLATE_DICT = {'allowed_enroll': ('emails/enroll_email_allowedsubject.txt', 'emails/enroll_email_allowedmessage.txt'),
-                           'enrolled_enroll': ('emails/enroll_email_enrolledsubject.txt', 'emails/enroll_email_enrolledmessage.txt'),
-                           'allowed_unenroll': ('emails/unenroll_email_subject.txt', 'emails/unenroll_email_allowedmessage.txt'),
-                           'enrolled_unenroll': ('emails/unenroll_email_subject.txt', 'emails/unenroll_email_enrolledmessage.txt')}
-
     subject_template, message_template = EMAIL_TEMPLATE_DICT.get(param_dict['message'], (None, None))
     if subject_template is not None and message_template is not None:
         subject = render_to_string(subject_template, param_dict)
@@ -1276,9 +1441,7 @@ def get_and_clean_student_list(students):
     students_lc: list of lower case cleaned student emails
     """
 
-    students = split_by_comma_and_whitespace(students)
-    students = [str(s.strip()) for s in students]
-    students = [s for s in students if s != '']
+    students = [str(name) for name in (s.strip() for s in split_by_comma_and_whitespace(students)) if name]
     students_lc = [x.lower() for x in students]
 
     return students, students_lc
@@ -1287,15 +1450,19 @@ def get_and_clean_student_list(students):
 # answer distribution
 
 
-def get_answers_distribution(request, course_id):
+def get_answers_distribution(request, course_id, course=None):
     """
     Get the distribution of answers for all graded problems in the course.
 
+    `course` may be passed in by callers that have already loaded the course
+    and checked staff access, to avoid fetching it from the modulestore again.
+
     Return a dict with two keys:
     'header': a header row
     'data': a list of rows
     """
-    course = get_course_with_access(request.user, course_id, 'staff')
+    if course is None:
+        course = get_course_with_access(request.user, course_id, 'staff')
 
     dist = grades.answer_distributions(request, course)
 
@@ -1393,13 +1560,14 @@ def get_background_task_table(course_id, problem_url, student=None):
     Returns a tuple of (msg, datatable), where the msg is a possible error message,
     and the datatable is the datatable to be used for display.
     """
-    history_entries = get_instructor_task_history(course_id, problem_url, student)
+    # evaluate the query once, rather than issuing a separate COUNT first
+    history_entries = list(get_instructor_task_history(course_id, problem_url, student))
     datatable = {}
     msg = ""
     # first check to see if there is any history at all
     # (note that we don't have to check that the arguments are valid; it
     # just won't find any entries.)
-    if (history_entries.count()) == 0:
+    if not history_entries:
         if student is not None:
             template = '<font color="red">Failed to find any background tasks for course "{course}", module "{problem}" and student "{student}".</font>'
             msg += template.format(course=course_id, problem=problem_url, student=student.username)
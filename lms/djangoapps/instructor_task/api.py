@@ -26,8 +26,9 @@ def get_running_instructor_tasks(course_id):
     Returns a query of InstructorTask objects of running tasks for a given course.
 
     Used to generate a list of tasks to display on the instructor dashboard.
+    The requester is fetched in the same query, since it is displayed too.
     """
-    instructor_tasks = InstructorTask.objects.filter(course_id=course_id)
+    instructor_tasks = InstructorTask.objects.filter(course_id=course_id).select_related('requester')
     # exclude states that are "ready" (i.e. not "running", e.g. failure, success, revoked):
     for state in READY_STATES:
         instructor_tasks = instructor_tasks.exclude(task_state=state)
@@ -38,10 +39,11 @@ def get_instructor_task_history(course_id, problem_url, student=None):
     """
     Returns a query of InstructorTask objects of historical tasks for a given course,
     that match a particular problem and optionally a student.
+    The requester is fetched in the same query.
     """
     _, task_key = encode_problem_and_student_input(problem_url, student)
 
-    instructor_tasks = InstructorTask.objects.filter(course_id=course_id, task_key=task_key)
+    instructor_tasks = InstructorTask.objects.filter(course_id=course_id, task_key=task_key).select_related('requester')
     return instructor_tasks.order_by('-id')
 
 
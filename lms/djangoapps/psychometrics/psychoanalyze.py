@@ -7,13 +7,14 @@ from __future__ import division
 
 import datetime
 import logging
+from collections import defaultdict
 import json
 import math
 import numpy as np
 from scipy.optimize import curve_fit
 
 from django.conf import settings
-from django.db.models import Sum, Max
+from django.db.models import Count, Sum, Max
 from psychometrics.models import PsychometricData
 from courseware.models import StudentModule
 from pytz import UTC
@@ -128,8 +129,9 @@ def problems_with_psychometric_data(course_id):
     Does this for a given course_id.
     '''
     pmdset = PsychometricData.objects.using(db).filter(studentmodule__course_id=course_id)
-    plist = [p['studentmodule__module_state_key'] for p in pmdset.values('studentmodule__module_state_key').distinct()]
-    problems = dict((p, pmdset.filter(studentmodule__module_state_key=p).count()) for p in plist)
+    # count per problem with a single GROUP BY, rather than one query per problem
+    counts = pmdset.values('studentmodule__module_state_key').annotate(count=Count('id'))
+    problems = dict((c['studentmodule__module_state_key'], c['count']) for c in counts)
 
     return problems
 
@@ -231,17 +233,23 @@ def generate_plots_for_problem(problem):
                 }
         plots.append(plot)
 
+    # count students by (grade, attempts) with a single GROUP BY, rather than
+    # separate queries for every grade and number of attempts
+    attempt_counts_by_grade = defaultdict(dict)
+    for row in pmdset.values('studentmodule__grade', 'attempts').annotate(count=Count('id')):
+        attempt_counts_by_grade[row['studentmodule__grade']][row['attempts']] = row['count']
+
     # one IRT plot curve for each grade received (TODO: this assumes integer grades)
     for grade in range(1, int(max_grade) + 1):
         yset = {}
-        gset = pmdset.filter(studentmodule__grade=grade)
-        ngset = gset.count()
+        attempt_counts = attempt_counts_by_grade.get(grade, {})
+        ngset = sum(attempt_counts.values())
         if ngset == 0:
             continue
         ydat = []
         ylast = 0
         for x in xdat:
-            y = gset.filter(attempts=x).count() / ngset
+            y = attempt_counts.get(x, 0) / ngset
             ydat.append(y + ylast)
             ylast = y + ylast
         yset['ydat'] = ydat